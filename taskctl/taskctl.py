@@ -1,47 +1,184 @@
 #!/usr/bin/env python3
 
-import argparse
 import signal
-import subprocess
 import os
+import sys
+import time
 from datetime import datetime
-import json
-import hashlib
-from typing import Optional, Literal
+import sqlite3
+from typing import Optional
 from pathlib import Path
-from enum import Enum
+from enum import IntEnum
 from dataclasses import dataclass, asdict
-import textwrap
+from types import SimpleNamespace
 
 
 LOG_DIR = Path.home() / ".taskctl"
+DB_PATH = LOG_DIR / "tasks.db"
+
+DONE_SUFFIX = ".done"
 
 def get_log_path(cmd_name: str) -> Path:
     return LOG_DIR / f"{cmd_name}.log"
 
-def get_info_path(cmd_name: str) -> Path:
-    return LOG_DIR / f"{cmd_name}.info.json"
+def get_done_path(cmd_name: str) -> Path:
+    return LOG_DIR / f"{cmd_name}{DONE_SUFFIX}"
+
+class Status(IntEnum):
+    RUNNING = 0
+    DONE = 1
+    STOPPED = 2
 
-class Status(Enum):
-    RUNNING = "running"
-    DONE = "done"
-    STOPPED = "stopped"
+FINISHED_STATUSES = frozenset({Status.STOPPED, Status.DONE})
+
+def format_status(value: int) -> str:
+    return Status(value).name.lower()
 
 @dataclass
 class TaskInfo:
     cmd: str
     cmd_name: str
     pid: int
-    start_time: str
+    start_time: float
     duration: Optional[float] = None
-    end_time: Optional[str] = None
-    status: Literal["running", "done", "stopped"] = Status.RUNNING.value
+    end_time: Optional[float] = None
+    status: int = Status.RUNNING
     exit_code: Optional[int] = None
 
+    @property
+    def status_name(self) -> str:
+        return format_status(self.status)
+
+INSERT_TASK_SQL = """
+    INSERT OR REPLACE INTO tasks (cmd, cmd_name, pid, start_time, duration, end_time, status, exit_code)
+    VALUES (:cmd, :cmd_name, :pid, :start_time, :duration, :end_time, :status, :exit_code)
+"""
+
+SCHEMA_VERSION = 1
+
+_db: Optional[sqlite3.Connection] = None
+
+def get_db() -> sqlite3.Connection:
+    global _db
+    if _db is None:
+        if not DB_PATH.exists():
+            LOG_DIR.mkdir(parents=False, exist_ok=True)
+        _db = sqlite3.connect(DB_PATH)
+        _db.row_factory = sqlite3.Row
+        _db.execute("PRAGMA journal_mode=WAL")
+        _db.execute("PRAGMA synchronous=NORMAL")
+        _db.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                cmd TEXT NOT NULL,
+                cmd_name TEXT PRIMARY KEY,
+                pid INTEGER NOT NULL,
+                start_time REAL NOT NULL,
+                duration REAL,
+                end_time REAL,
+                status INTEGER NOT NULL,
+                exit_code INTEGER
+            )
+        """)
+        if _db.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            _import_info_files(_db)
+    return _db
+
+def close_db():
+    global _db
+    if _db is not None:
+        _db.close()
+        _db = None
+
+def _import_info_files(db: sqlite3.Connection):
+    # 迁移旧版本按任务存放的 .info.json 文件；迁移完成与数据写入在同一事务中以 user_version 标记
+    import json
+
+    imported = []
+    broken = []
+    with db:
+        # 立即加写锁，并发的首次运行会在此等待并看到已完成的标记
+        db.execute("BEGIN IMMEDIATE")
+        if db.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return
+        with os.scandir(LOG_DIR) as it:
+            info_files = [entry.path for entry in it if entry.name.endswith(".info.json")]
+        records = []
+        for info_file in info_files:
+            try:
+                with open(info_file, "r") as f:
+                    record = json.load(f)
+                for key in ("start_time", "end_time"):
+                    if record.get(key) is not None:
+                        record[key] = datetime.fromisoformat(record[key]).timestamp()
+                record["status"] = Status[record["status"].upper()]
+                records.append(asdict(TaskInfo(**record)))
+            except (OSError, ValueError, TypeError, KeyError, AttributeError):
+                broken.append(info_file)
+                continue
+            imported.append(info_file)
+        db.executemany(INSERT_TASK_SQL, records)
+        db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    for info_file in imported:
+        Path(info_file).unlink(missing_ok=True)
+    for info_file in broken:
+        try:
+            os.replace(info_file, f"{info_file}.bad")
+        except FileNotFoundError:
+            continue
+        print(f"无法迁移任务信息文件 {info_file}，已重命名为 {info_file}.bad")
+
+def reconcile(cmd_name: Optional[str] = None):
+    # 任务结束时由 shell 写入 <cmd_name>.done，内容为退出代码，mtime 即结束时间
+    db = get_db()
+    if cmd_name is not None:
+        done_files = [get_done_path(cmd_name)]
+    else:
+        with os.scandir(LOG_DIR) as it:
+            done_files = [Path(entry.path) for entry in it if entry.name.endswith(DONE_SUFFIX)]
+    for done_file in done_files:
+        try:
+            with done_file.open("r") as f:
+                exit_code = int(f.read())
+                end_time = os.fstat(f.fileno()).st_mtime
+        except (OSError, ValueError):
+            continue
+        name = done_file.name[:-len(DONE_SUFFIX)]
+        with db:
+            row = db.execute("SELECT start_time, status FROM tasks WHERE cmd_name = ?", (name,)).fetchone()
+            if row is None:
+                # 任务记录可能尚未写入，保留标记等待下次合并
+                continue
+            if row["status"] == Status.RUNNING:
+                db.execute(
+                    "UPDATE tasks SET status = ?, end_time = ?, duration = ?, exit_code = ? WHERE cmd_name = ?",
+                    (Status.DONE, end_time, round(end_time - row["start_time"], 6), exit_code, name),
+                )
+        done_file.unlink(missing_ok=True)
+
+def load_info(cmd_name: str) -> Optional[TaskInfo]:
+    reconcile(cmd_name)
+    row = get_db().execute("SELECT * FROM tasks WHERE cmd_name = ?", (cmd_name,)).fetchone()
+    return TaskInfo(**row) if row else None
+
+def load_task_rows(columns: str = "*") -> list[sqlite3.Row]:
+    # 批量查询直接返回行，只取需要的列，不构造 TaskInfo
+    reconcile()
+    return get_db().execute(f"SELECT {columns} FROM tasks").fetchall()
+
+def save_info(info: TaskInfo):
+    db = get_db()
+    with db:
+        db.execute(INSERT_TASK_SQL, asdict(info))
+
+def format_time(timestamp: Optional[float]) -> str:
+    if timestamp is None:
+        return "-"
+    return datetime.fromtimestamp(timestamp).isoformat(sep=" ", timespec="microseconds")
+
 def is_pid_running(pid: int) -> bool:
+    # 任务均以新会话启动，pid 必为会话首进程；据此排除 pid 已被其他进程复用的情况
     try:
-        os.kill(pid, 0)
-        return True
+        return os.getsid(pid) == pid
     except OSError:
         return False
 
@@ -51,60 +188,78 @@ def tail_log(log_file: Path, num_lines=10):
         return
 
     print(f"正在查看日志: {log_file}")
+    # 直接以 tail 替换当前进程，不再保留 Python 解释器等待
+    sys.stdout.flush()
+    close_db()
     try:
-        subprocess.run(["tail", "-n", str(num_lines), "-f", str(log_file)])
-    except KeyboardInterrupt:
-        print("\n已退出日志查看模式")
+        os.execvp("tail", ["tail", "-n", str(num_lines), "-f", str(log_file)])
+    except OSError as e:
+        print(f"无法启动 tail: {e}")
 
 
 def run(cmd_string: str, cmd_name: Optional[str], watch: bool):
-    now = datetime.now()
+    # 仅 run 需要的模块按需导入，缩短其他子命令的启动时间
+    import hashlib
+    import shlex
+    import subprocess
+    import textwrap
+
+    start_time = time.time()
     if cmd_name is None:
-        cmd_name = f"{now.strftime('%Y%m%d%H%M%S')}_{hashlib.md5(cmd_string.encode()).hexdigest()}"
+        cmd_name = f"{datetime.fromtimestamp(start_time).strftime('%Y%m%d%H%M%S')}_{hashlib.blake2b(cmd_string.encode(), digest_size=8).hexdigest()}"
     log_file = get_log_path(cmd_name)
-    info_file = get_info_path(cmd_name)
-    if info_file.exists():
-        with info_file.open("r") as f:
-            existing_info = TaskInfo(**json.load(f))
-            if existing_info.status == Status.RUNNING.value and is_pid_running(existing_info.pid):
-                print(f"任务 [{cmd_name}] 已存在且正在运行，无法重复启动")
-                return
-            else:
-                print(f"任务 [{cmd_name}] 已完成，覆盖旧文件")
-    info_file.unlink(missing_ok=True)
+    existing_info = load_info(cmd_name)
+    if existing_info is not None:
+        if existing_info.status == Status.RUNNING and is_pid_running(existing_info.pid):
+            print(f"任务 [{cmd_name}] 已存在且正在运行，无法重复启动")
+            return
+        else:
+            print(f"任务 [{cmd_name}] 已完成，覆盖旧文件")
+    done_file = get_done_path(cmd_name)
     log_file.unlink(missing_ok=True)
+    done_file.unlink(missing_ok=True)
+    # 先删除旧记录，使新任务的完成标记在记录写入前始终被保留
+    db = get_db()
+    with db:
+        db.execute("DELETE FROM tasks WHERE cmd_name = ?", (cmd_name,))
     print(f"启动任务 [{cmd_name}]: {cmd_string}")
+    # 结束时直接由 shell 写入完成标记，避免再启动一个 Python 解释器执行 callback
     wrapped_cmd = textwrap.dedent(f"""
+        (
         {cmd_string}
+        )
         EXIT_CODE=$?
-        python3 {__file__} callback "{cmd_name}" $EXIT_CODE
+        echo {shlex.quote(f"任务 [{cmd_name}] 已完成，退出代码:")} $EXIT_CODE
+        printf '%d' $EXIT_CODE > {shlex.quote(str(done_file))}
         exit $EXIT_CODE
     """).strip()
-    process = subprocess.Popen(
-        ["bash", "-c", wrapped_cmd],
-        stdout=log_file.open("a"),
-        stderr=subprocess.STDOUT,
-        preexec_fn=os.setsid,
-    )
+    log_fd = os.open(log_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT | os.O_CLOEXEC, 0o644)
+    try:
+        process = subprocess.Popen(
+            ["bash", "-c", wrapped_cmd],
+            stdout=log_fd,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+    finally:
+        os.close(log_fd)
     pid = process.pid
     info = TaskInfo(
         cmd=cmd_string,
         cmd_name=cmd_name,
         pid=pid,
-        start_time=now.strftime("%Y-%m-%d %H:%M:%S.%f"),
+        start_time=start_time,
     )
-    info_file.write_text(json.dumps(asdict(info), indent=4))
+    save_info(info)
     if watch:
         print("进入 watch 模式...")
         tail_log(log_file)
 
 def get_running_tasks() -> list[str]:
     cmd_names = []
-    for info_file in LOG_DIR.glob("*.info.json"):
-        with info_file.open("r") as f:
-            info = TaskInfo(**json.load(f))
-            if info.status == Status.RUNNING.value and is_pid_running(info.pid):
-                cmd_names.append(info.cmd_name)
+    for row in load_task_rows("cmd_name, pid, status"):
+        if row["status"] == Status.RUNNING and is_pid_running(row["pid"]):
+            cmd_names.append(row["cmd_name"])
     return cmd_names
 
 def stop(cmd_name: Optional[str]):
@@ -127,22 +282,23 @@ def stop(cmd_name: Optional[str]):
         else:
             cmd_name = cmd_names[0]
 
-    info_file = get_info_path(cmd_name)
-    if not info_file.exists():
+    info = load_info(cmd_name)
+    if info is None:
         print(f"任务 [{cmd_name}] 不存在")
         return
 
-    with info_file.open("r") as f:
-        info = TaskInfo(**json.load(f))
-    if info.status != Status.RUNNING.value or not is_pid_running(info.pid):
+    if info.status != Status.RUNNING or not is_pid_running(info.pid):
         print(f"任务 [{cmd_name}] 未在运行中")
         return
     os.killpg(os.getpgid(info.pid), signal.SIGTERM)
-    info.status = Status.STOPPED.value
-    info.end_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
-    info.duration = (datetime.strptime(info.end_time, "%Y-%m-%d %H:%M:%S.%f") - datetime.strptime(info.start_time, "%Y-%m-%d %H:%M:%S.%f")).total_seconds()
-    with info_file.open("w") as f:
-        json.dump(asdict(info), f, indent=4)
+    end_time = time.time()
+    duration = round(end_time - info.start_time, 6)
+    db = get_db()
+    with db:
+        db.execute(
+            "UPDATE tasks SET status = ?, end_time = ?, duration = ? WHERE cmd_name = ? AND status = ?",
+            (Status.STOPPED, end_time, duration, cmd_name, Status.RUNNING),
+        )
     print(f"任务 [{cmd_name}] 已停止")
 
 def watch(cmd_name: Optional[str], num_lines: int):
@@ -174,125 +330,134 @@ def watch(cmd_name: Optional[str], num_lines: int):
     tail_log(log_file, num_lines)
 
 def get_stopped_tasks() -> list[str]:
-    cmd_names = []
-    for info_file in LOG_DIR.glob("*.info.json"):
-        with info_file.open("r") as f:
-            info = TaskInfo(**json.load(f))
-            if info.status in {Status.STOPPED.value, Status.DONE.value}:
-                cmd_names.append(info.cmd_name)
-            if not is_pid_running(info.pid):
-                cmd_names.append(info.cmd_name)
-    return cmd_names
+    # 已结束的任务无需再检测进程；cmd_name 为主键，结果不会重复
+    return [
+        row["cmd_name"]
+        for row in load_task_rows("cmd_name, pid, status")
+        if row["status"] in FINISHED_STATUSES or not is_pid_running(row["pid"])
+    ]
 
 def clear():
     confirm = input(f"确定要清空日志目录 [{LOG_DIR}] 吗？此操作不可撤销！(y/N): ")
     if confirm.lower() == 'y':
-        tasks = get_stopped_tasks()
-        for task in tasks:
-            log_file = get_log_path(task)
-            info_file = get_info_path(task)
-            log_file.unlink(missing_ok=True)
-            info_file.unlink(missing_ok=True)
+        tasks = set(get_stopped_tasks())
+        db = get_db()
+        with db:
+            db.executemany("DELETE FROM tasks WHERE cmd_name = ?", [(task,) for task in tasks])
+        remaining = {row["cmd_name"] for row in db.execute("SELECT cmd_name FROM tasks")}
+        # 单次遍历目录，只删除实际存在的文件；没有对应记录的完成标记一并清理
+        with os.scandir(LOG_DIR) as it:
+            for entry in it:
+                stem, ext = os.path.splitext(entry.name)
+                if (ext == ".log" and stem in tasks) or (ext == DONE_SUFFIX and stem not in remaining):
+                    os.unlink(entry.path)
         print("日志目录已清空")
     else:
         print("操作已取消")
 
 def list_():
-    all_tasks = []
-    for info_file in LOG_DIR.glob("*.info.json"):
-        with info_file.open("r") as f:
-            info = TaskInfo(**json.load(f))
-            all_tasks.append(info)
+    all_tasks = load_task_rows("cmd_name, status, pid, start_time, end_time, duration")
 
     if not all_tasks:
         print("当前没有任何任务")
         return
 
-    print(f"{'任务名称':<20} {'状态':<10} {'PID':<10} {'开始时间':<20} {'结束时间':<20} {'持续时间(秒)':<15}")
-    print("-" * 95)
-    for info in all_tasks:
-        end_time = info.end_time if info.end_time else "-"
-        duration = f"{info.duration:.2f}" if info.duration else "-"
-        print(f"{info.cmd_name:<20} {info.status:<10} {info.pid:<10} {info.start_time:<20} {end_time:<20} {duration:<15}")
+    fmt = "{:<20} {:<10} {:<10} {:<20} {:<20} {:<15}".format
+    lines = [fmt("任务名称", "状态", "PID", "开始时间", "结束时间", "持续时间(秒)"), "-" * 95]
+    for row in all_tasks:
+        duration = f"{row['duration']:.2f}" if row["duration"] else "-"
+        lines.append(fmt(row["cmd_name"], format_status(row["status"]), row["pid"], format_time(row["start_time"]), format_time(row["end_time"]), duration))
+    sys.stdout.write("\n".join(lines) + "\n")
 
 def info(cmd_name: str):
-    info_file = get_info_path(cmd_name)
-    if not info_file.exists():
+    info = load_info(cmd_name)
+    if info is None:
         print(f"任务 [{cmd_name}] 不存在")
         return
 
-    with info_file.open("r") as f:
-        info = TaskInfo(**json.load(f))
-
     print(f"任务名称: {info.cmd_name}")
     print(f"命令: {info.cmd}")
-    print(f"状态: {info.status}")
+    print(f"状态: {info.status_name}")
     print(f"PID: {info.pid}")
-    print(f"开始时间: {info.start_time}")
-    print(f"结束时间: {info.end_time if info.end_time else '-'}")
+    print(f"开始时间: {format_time(info.start_time)}")
+    print(f"结束时间: {format_time(info.end_time)}")
     print(f"持续时间(秒): {info.duration if info.duration else '-'}")
     print(f"退出代码: {info.exit_code if info.exit_code is not None else '-'}")
 
+# 兼容旧版本启动的任务，其包装脚本结束时仍会调用 callback
 def callback(cmd_name: str, exit_code: int):
-    info_file = get_info_path(cmd_name)
-    if not info_file.exists():
-        print(f"任务 [{cmd_name}] 的信息文件不存在，无法执行回调")
+    info = load_info(cmd_name)
+    if info is None:
+        print(f"任务 [{cmd_name}] 的信息不存在，无法执行回调")
         return
 
-    with info_file.open("r") as f:
-        info = TaskInfo(**json.load(f))
-
-    info.exit_code = exit_code
-    info.end_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
-    info.duration = (datetime.strptime(info.end_time, "%Y-%m-%d %H:%M:%S.%f") - datetime.strptime(info.start_time, "%Y-%m-%d %H:%M:%S.%f")).total_seconds()
-    info.status = Status.DONE.value
-    print(f"任务 [{cmd_name}] 已完成，退出代码: {exit_code}")
-
-    with info_file.open("w") as f:
-        json.dump(asdict(info), f, indent=4)
+    end_time = time.time()
+    duration = round(end_time - info.start_time, 6)
+    db = get_db()
+    with db:
+        updated = db.execute(
+            "UPDATE tasks SET status = ?, end_time = ?, duration = ?, exit_code = ? WHERE cmd_name = ? AND status = ?",
+            (Status.DONE, end_time, duration, exit_code, cmd_name, Status.RUNNING),
+        ).rowcount
+    if updated:
+        print(f"任务 [{cmd_name}] 已完成，退出代码: {exit_code}")
+    else:
+        print(f"任务 [{cmd_name}] 已不在运行中，忽略回调")
 
 def rename(old_name: str, new_name: str):
     old_log = get_log_path(old_name)
-    old_info = get_info_path(old_name)
     new_log = get_log_path(new_name)
-    new_info = get_info_path(new_name)
 
-    if not old_info.exists():
+    info = load_info(old_name)
+    if info is None:
         print(f"任务 [{old_name}] 不存在，无法重命名")
         return
-    if new_info.exists():
+    # 运行中任务的完成标记路径已固定为旧名称，重命名后将无法合并
+    if info.status == Status.RUNNING and is_pid_running(info.pid):
+        print(f"任务 [{old_name}] 正在运行中，无法重命名")
+        return
+    if load_info(new_name) is not None:
         print(f"任务 [{new_name}] 已存在，无法重命名为已存在的任务名")
         return
 
     old_log.rename(new_log)
-    old_info.rename(new_info)
-
-    with new_info.open("r") as f:
-        info = TaskInfo(**json.load(f))
-    info.cmd_name = new_name
-    with new_info.open("w") as f:
-        json.dump(asdict(info), f, indent=4)
+    db = get_db()
+    with db:
+        db.execute("UPDATE tasks SET cmd_name = ? WHERE cmd_name = ?", (new_name, old_name))
 
     print(f"任务 [{old_name}] 已重命名为 [{new_name}]")
 
 def rerun(cmd_name: str, watch: bool):
-    info_file = get_info_path(cmd_name)
-    if not info_file.exists():
+    info = load_info(cmd_name)
+    if info is None:
         print(f"任务 [{cmd_name}] 不存在，无法重新运行")
         return
 
-    with info_file.open("r") as f:
-        info = TaskInfo(**json.load(f))
-
-    if info.status == Status.RUNNING.value and is_pid_running(info.pid):
+    if info.status == Status.RUNNING and is_pid_running(info.pid):
         print(f"任务 [{cmd_name}] 正在运行中，无法重新运行")
         return
 
     # 重新运行任务
-    run(info.cmd, cmd_name, watch)
+    run(info.cmd, cmd_name, False)
     print(f"任务 [{cmd_name}] 已重新运行")
+    if watch:
+        print("进入 watch 模式...")
+        tail_log(get_log_path(cmd_name))
+
+def parse_fast_args(argv: list[str]) -> Optional[SimpleNamespace]:
+    # list/clear/callback 的参数形式固定，无需构建完整的 argparse 解析器
+    if argv == ["list"] or argv == ["clear"]:
+        return SimpleNamespace(command=argv[0])
+    if len(argv) == 3 and argv[0] == "callback":
+        try:
+            return SimpleNamespace(command="callback", cmd_name=argv[1], exit_code=int(argv[2]))
+        except ValueError:
+            return None
+    return None
+
+def parse_args(argv: list[str]):
+    import argparse
 
-def main():
     parser = argparse.ArgumentParser(description="任务后台管理工具")
     subparsers = parser.add_subparsers(dest="command", required=True)
 
@@ -327,9 +492,11 @@ def main():
     rerun_parser.add_argument("cmd_name", help="任务名称")
     rerun_parser.add_argument("-w", "--watch", action="store_true", help="实时查看日志")
 
-    args = parser.parse_args()
+    return parser.parse_args(argv)
 
-    LOG_DIR.mkdir(parents=False, exist_ok=True)
+def main():
+    argv = sys.argv[1:]
+    args = parse_fast_args(argv) or parse_args(argv)
 
     if args.command == "run":
         run(args.cmd_string, args.cmd_name, args.watch)